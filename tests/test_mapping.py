@@ -1,6 +1,9 @@
 import pytest
 import json
-from mapping import cleanup_text, parse_person_name, try_parse_json_list, map_to_schema_org
+import requests
+from concurrent.futures import ThreadPoolExecutor
+import mapping
+from mapping import cleanup_text, parse_person_name, try_parse_json_list, map_to_schema_org, fetch_all_packages_paged, write_json_array, fetch_package_details, map_pages
 
 def test_cleanup_text_html_tags():
     html_input = "<div class=\"row\">Hello <br> world! <p>This is a test.</p></div>"
@@ -22,6 +25,9 @@ def test_cleanup_text_spaces():
     expected = "Too many spaces"
     assert cleanup_text(space_input) == expected
 
+def test_cleanup_text_plain_text():
+    assert cleanup_text("Yield > 5 t/ha;\tsoil\r\n  data") == "Yield > 5 t/ha; soil data"
+
 def test_parse_person_name_simple():
     res = parse_person_name("John Doe")
     assert res == {"name": "John Doe", "givenName": "John", "familyName": "Doe"}
@@ -34,9 +40,14 @@ def test_parse_person_name_single():
     res = parse_person_name("John")
     assert res == {"name": "John", "givenName": "John"}
 
+def test_parse_person_name_irregular_whitespace():
+    res = parse_person_name(" John \t Middle  Doe ")
+    assert res == {"name": " John \t Middle  Doe ", "givenName": "John Middle", "familyName": "Doe"}
+
 def test_parse_person_name_empty():
     assert parse_person_name("") == {}
     assert parse_person_name(None) == {}
+    assert parse_person_name("   ") == {}
 
 def test_try_parse_json_list_valid():
     json_str = '[{"name": "A"}, {"name": "B"}]'
@@ -53,6 +64,12 @@ def test_try_parse_json_list_dict():
 def test_try_parse_json_list_invalid():
     assert try_parse_json_list("not json") == []
     assert try_parse_json_list(None) == []
+    assert try_parse_json_list("Jane Smith") == []
+    assert try_parse_json_list("[not json") == []
+    assert try_parse_json_list("   ") == []
+
+def test_try_parse_json_list_leading_whitespace():
+    assert try_parse_json_list('  \n[{"name": "A"}]') == [{"name": "A"}]
 
 def test_map_to_schema_org():
     mock_ckan = {
@@ -79,3 +96,167 @@ def test_map_to_schema_org():
     assert res["creator"][0]["givenName"] == "Jane"
     assert res["creator"][0]["familyName"] == "Smith"
     assert res["distribution"][0]["contentUrl"] == "http://res.url"
+
+def test_fetch_all_packages_paged(monkeypatch):
+    catalog = [{"name": f"pkg-{i}"} for i in range(7)]
+    requested = []
+
+    def fake_fetch_package_page(start, rows):
+        requested.append(start)
+        return len(catalog), catalog[start:start + rows]
+
+    monkeypatch.setattr(mapping, "fetch_package_page", fake_fetch_package_page)
+    pages = list(fetch_all_packages_paged(rows=3))
+    assert sorted(requested) == [0, 3, 6]
+    assert [pkg for page in pages for pkg in page] == catalog
+
+def test_fetch_all_packages_paged_respects_server_row_cap(monkeypatch):
+    catalog = [{"name": f"pkg-{i}"} for i in range(25)]
+    monkeypatch.setattr(mapping, "fetch_package_page", lambda start, rows: (len(catalog), catalog[start:start + min(rows, 4)]))
+    pages = list(fetch_all_packages_paged(rows=10))
+    assert [pkg for page in pages for pkg in page] == catalog
+
+def test_fetch_all_packages_paged_failed_page_raises(monkeypatch):
+    catalog = [{"name": f"pkg-{i}"} for i in range(7)]
+
+    def fake_fetch_package_page(start, rows):
+        if start == 3:
+            return None
+        return len(catalog), catalog[start:start + rows]
+
+    monkeypatch.setattr(mapping, "fetch_package_page", fake_fetch_package_page)
+    with pytest.raises(RuntimeError):
+        list(fetch_all_packages_paged(rows=3))
+
+def test_fetch_all_packages_paged_count_mismatch_raises(monkeypatch):
+    catalog = [{"name": f"pkg-{i}"} for i in range(7)]
+    # The page at offset 3 comes back one package short (e.g. deleted mid-crawl).
+    monkeypatch.setattr(mapping, "fetch_package_page", lambda start, rows: (len(catalog), catalog[start:start + rows - (start == 3)]))
+    with pytest.raises(RuntimeError):
+        list(fetch_all_packages_paged(rows=3))
+
+def test_fetch_all_packages_paged_empty(monkeypatch):
+    def no_fallback():
+        raise AssertionError("an empty catalog must not trigger the fallback")
+
+    monkeypatch.setattr(mapping, "fetch_package_page", lambda start, rows: (0, []))
+    monkeypatch.setattr(mapping, "fetch_package_list", no_fallback)
+    assert list(fetch_all_packages_paged()) == []
+
+def test_fetch_all_packages_paged_falls_back_to_package_show(monkeypatch):
+    monkeypatch.setattr(mapping, "fetch_package_page", lambda start, rows: None)
+    monkeypatch.setattr(mapping, "fetch_package_list", lambda: ["a", "b", "c"])
+    monkeypatch.setattr(mapping, "fetch_package_details", lambda name: {"name": name})
+    pages = list(fetch_all_packages_paged(rows=2))
+    assert pages == [[{"name": "a"}, {"name": "b"}], [{"name": "c"}]]
+
+def test_fetch_all_packages_by_name_failed_lookup_raises(monkeypatch):
+    monkeypatch.setattr(mapping, "fetch_package_list", lambda: ["a", "broken", "b", "c"])
+    monkeypatch.setattr(mapping, "fetch_package_details", lambda name: {} if name == "broken" else {"name": name})
+    with pytest.raises(RuntimeError):
+        list(mapping.fetch_all_packages_by_name(batch_size=2))
+
+def test_write_json_array_matches_json_dump(tmp_path):
+    records = [
+        {"name": "Ä dataset", "keywords": ["a", "b"], "description": "line\nbreak"},
+        {"name": "second", "creator": [{"@type": "Person", "name": "Jane"}], "distribution": []},
+    ]
+    path = tmp_path / "out.jsonld"
+    assert write_json_array(str(path), iter(records)) == 2
+    assert path.read_text(encoding="utf-8") == json.dumps(records, indent=2, ensure_ascii=False)
+
+def test_write_json_array_empty(tmp_path):
+    path = tmp_path / "out.jsonld"
+    assert write_json_array(str(path), []) == 0
+    assert json.loads(path.read_text(encoding="utf-8")) == []
+
+def test_map_to_schema_org_does_not_mutate_cached_names():
+    mock_ckan = {"author": '[{"author_name": "Jane Smith", "author_email": "jane@example.com"}]'}
+    map_to_schema_org(mock_ckan)
+    map_to_schema_org(mock_ckan)
+    assert parse_person_name("Jane Smith") == {"name": "Jane Smith", "givenName": "Jane", "familyName": "Smith"}
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.content = json.dumps(payload).encode("utf-8")
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def raise_for_status(self):
+        pass
+
+def test_fetch_package_details(monkeypatch):
+    def fake_get(url, params=None, timeout=None):
+        if params["id"] == "missing":
+            return FakeResponse({"success": False, "error": {"message": "Not found"}})
+        return FakeResponse({"success": True, "result": {"name": params["id"]}})
+
+    monkeypatch.setattr(mapping.SESSION, "get", fake_get)
+    assert fetch_package_details("pkg") == {"name": "pkg"}
+    assert fetch_package_details("missing") == {}
+
+def test_map_pages_preserves_order():
+    pages = [[{"title": f"ds-{p}-{i}"} for i in range(p + 1)] for p in range(4)]
+    titles = [ds["name"] for ds in map_pages(iter(pages), lambda: ThreadPoolExecutor(max_workers=4))]
+    assert titles == [ckan["title"] for page in pages for ckan in page]
+
+def test_map_pages_single_page_maps_in_process():
+    def no_pool():
+        raise AssertionError("a single page must not start a pool")
+
+    pages = [[{"title": "a"}, {"title": "b"}]]
+    assert [ds["name"] for ds in map_pages(iter(pages), no_pool)] == ["a", "b"]
+    assert list(map_pages(iter([]), no_pool)) == []
+
+def test_make_mapping_pool_without_forkserver(monkeypatch):
+    monkeypatch.setattr(mapping.multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    with mapping.make_mapping_pool() as pool:
+        assert pool.submit(cleanup_text, "<b>ok</b>").result() == "ok"
+
+def test_map_pages_process_pool():
+    pages = [[{"title": f"ds-{p}-{i}", "notes": "<p>x</p>"} for i in range(3)] for p in range(3)]
+    datasets = list(map_pages(iter(pages)))
+    assert datasets == [map_to_schema_org(ckan) for page in pages for ckan in page]
+
+def test_main_failure_keeps_previous_output(monkeypatch, tmp_path):
+    output_file = tmp_path / "out.jsonld"
+    output_file.write_text("previous", encoding="utf-8")
+
+    def failing_crawl():
+        raise RuntimeError("crawl failed")
+        yield
+
+    monkeypatch.setattr(mapping, "OUTPUT_FILE", str(output_file))
+    monkeypatch.setattr(mapping, "fetch_all_packages_paged", failing_crawl)
+    with pytest.raises(RuntimeError):
+        mapping.main()
+    assert output_file.read_text(encoding="utf-8") == "previous"
+    assert not (tmp_path / "out.jsonld.tmp").exists()
+
+def test_bounded_map_limits_calls_in_flight():
+    started = []
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = mapping._bounded_map(executor, lambda x: started.append(x) or x * 2, range(10), max_in_flight=3)
+        assert next(results) == 0
+        assert len(started) <= 3
+        assert list(results) == [x * 2 for x in range(1, 10)]
+
+def test_fetch_package_page(monkeypatch):
+    responses = {
+        0: FakeResponse({"success": True, "result": {"count": 1, "results": [{"name": "a"}]}}),
+        1: FakeResponse({"success": False, "error": {"message": "Search error"}}),
+        2: FakeResponse({}, status_code=500),
+    }
+    monkeypatch.setattr(mapping.SESSION, "get", lambda url, params=None, timeout=None: responses[params["start"]])
+    assert mapping.fetch_package_page(0) == (1, [{"name": "a"}])
+    assert mapping.fetch_package_page(1) is None
+    assert mapping.fetch_package_page(2) is None
+
+def test_fetch_package_page_network_error_is_not_a_fallback(monkeypatch):
+    def timeout(url, params=None, timeout=None):
+        raise requests.Timeout("read timed out")
+
+    monkeypatch.setattr(mapping.SESSION, "get", timeout)
+    monkeypatch.setattr(mapping, "fetch_package_list", lambda: pytest.fail("must not fall back"))
+    with pytest.raises(requests.Timeout):
+        list(fetch_all_packages_paged())